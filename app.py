@@ -37,8 +37,6 @@
 
 from flask import Flask, jsonify, request, send_from_directory
 import os
-from pathlib import Path
-from werkzeug.utils import secure_filename
 from flask_cors import CORS
 from database_query import DrugDatabase
 from image_recognition import DrugImageRecognizer, detect_image_type
@@ -64,12 +62,8 @@ CORS(
     },
 )
 DB_PATH = "drug_recognition.db"
-UPLOAD_FOLDER = "uploads"
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "bmp"}
 
-# 確保上傳資料夾存在
-Path(UPLOAD_FOLDER).mkdir(exist_ok=True)
-
 # 初始化影像辨識器
 feature_recognizer = DrugImageRecognizer(DB_PATH)
 
@@ -334,17 +328,8 @@ def recognize_drug():
         )
 
     try:
-        # 安全的檔案名稱 (防止路徑穿越攻擊)
-        filename = secure_filename(file.filename)
-        # 加上時間戳避免檔名衝突
-        import time
-
-        timestamp = int(time.time())
-        filename = f"{timestamp}_{filename}"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-
-        # 儲存檔案到伺服器
-        file.save(filepath)
+        # 直接讀取上傳內容，在記憶體中解碼（不寫入暫存檔再讀回）
+        image_bytes = file.read()
 
         # 獲取辨識參數
         model_type = request.form.get(
@@ -393,8 +378,8 @@ def recognize_drug():
 
         try:
             # 呼叫辨識器並套用篩選（帶入 hooks）
-            results = feature_recognizer.recognize_drug(
-                filepath,
+            results = feature_recognizer.recognize_drug_from_bytes(
+                image_bytes,
                 top_k=top_k,
                 filter_shape=filter_shape,
                 filter_color=filter_color,
@@ -407,9 +392,6 @@ def recognize_drug():
             # 清理取消旗標（保留進度一段時間供前端讀取）
             CANCEL_FLAGS.pop(request_id, None)
 
-        # 清理檔案
-        Path(filepath).unlink(missing_ok=True)
-
         if not results:
             filter_msg = []
             if filter_shape:
@@ -462,10 +444,6 @@ def recognize_drug():
         )
 
     except Exception as e:
-        # 清理可能存在的上傳檔案
-        if "filepath" in locals():
-            Path(filepath).unlink(missing_ok=True)
-
         return (
             jsonify({"success": False, "message": f"辨識過程發生錯誤: {str(e)}"}),
             500,
@@ -83,11 +83,10 @@ for row in cursor.fetchall():
 print("\n" + "=" * 60)
 print("統計:")
 print("=" * 60)
-cursor.execute("SELECT COUNT(*) FROM drug_images")
-print(f"總圖片數: {cursor.fetchone()[0]}")
-
-cursor.execute("SELECT COUNT(DISTINCT drug_id) FROM drug_images")
-print(f"有圖片的藥物數: {cursor.fetchone()[0]}")
+cursor.execute("SELECT COUNT(*), COUNT(DISTINCT drug_id) FROM drug_images")
+total_images, drugs_with_images = cursor.fetchone()
+print(f"總圖片數: {total_images}")
+print(f"有圖片的藥物數: {drugs_with_images}")
 
 cursor.execute(
     "SELECT drug_id, COUNT(*) as cnt FROM drug_images GROUP BY drug_id HAVING cnt > 1 LIMIT 5"
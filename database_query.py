@@ -54,6 +54,58 @@ import sqlite3
 import os
 from typing import List, Dict, Optional
 
+# 開啟連線時套用的 PRAGMA：WAL + NORMAL 同步、暫存表放記憶體
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+)
+
+# 藥名全文索引：FTS5 trigram 斷詞可讓 '%關鍵字%' 子字串查詢走倒排索引（需 SQLite 3.34+），
+# 以觸發器與 drugs 資料表同步（管理工具直接修改 drugs 時也會更新）。
+# 只由 scripts/create_name_index.py 明確建立，查詢路徑不會修改資料庫結構
+_NAME_INDEX_STATEMENTS = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS drugs_fts USING fts5(
+        chinese_name, english_name,
+        content='drugs', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS drugs_fts_ai AFTER INSERT ON drugs BEGIN
+        INSERT INTO drugs_fts(rowid, chinese_name, english_name)
+        VALUES (new.id, new.chinese_name, new.english_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS drugs_fts_ad AFTER DELETE ON drugs BEGIN
+        INSERT INTO drugs_fts(drugs_fts, rowid, chinese_name, english_name)
+        VALUES ('delete', old.id, old.chinese_name, old.english_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS drugs_fts_au
+    AFTER UPDATE OF chinese_name, english_name ON drugs BEGIN
+        INSERT INTO drugs_fts(drugs_fts, rowid, chinese_name, english_name)
+        VALUES ('delete', old.id, old.chinese_name, old.english_name);
+        INSERT INTO drugs_fts(rowid, chinese_name, english_name)
+        VALUES (new.id, new.chinese_name, new.english_name);
+    END
+    """,
+    "INSERT INTO drugs_fts(drugs_fts) VALUES ('rebuild')",
+)
+
+# 移除藥名全文索引（先移除觸發器，避免寫入 drugs 時觸發不存在的 drugs_fts）
+_NAME_INDEX_DROP_STATEMENTS = (
+    "DROP TRIGGER IF EXISTS drugs_fts_ai",
+    "DROP TRIGGER IF EXISTS drugs_fts_ad",
+    "DROP TRIGGER IF EXISTS drugs_fts_au",
+    "DROP TABLE IF EXISTS drugs_fts",
+)
+
+# trigram 斷詞最短可查詢長度（較短的關鍵字仍使用 LIKE 掃描）
+_NAME_INDEX_MIN_QUERY = 3
+
 
 class DrugDatabase:
     """
@@ -79,6 +131,7 @@ class DrugDatabase:
         """
         self.db_file = db_file
         self.conn = None
+        self._name_index = None  # 是否可使用 drugs_fts（首次名稱搜尋時檢查，不會建立）
 
     def connect(self):
         """
@@ -87,10 +140,16 @@ class DrugDatabase:
         說明:
         - 使用 sqlite3.Row 作為 row_factory，讓查詢結果可像字典般存取
         - 例如: row['chinese_name'] 而非 row[0]
+        - 套用 _SQLITE_PRAGMAS；資料庫唯讀等原因導致失敗時略過該項
         """
         if not self.conn:
             self.conn = sqlite3.connect(self.db_file)
             self.conn.row_factory = sqlite3.Row  # 讓結果可以像字典一樣訪問
+            for pragma in _SQLITE_PRAGMAS:
+                try:
+                    self.conn.execute(pragma)
+                except sqlite3.Error:
+                    pass
 
     def close(self):
         """
@@ -99,6 +158,7 @@ class DrugDatabase:
         if self.conn:
             self.conn.close()
             self.conn = None
+            self._name_index = None
 
     def __enter__(self):
         """
@@ -123,6 +183,58 @@ class DrugDatabase:
 
     # ===== 名稱搜索功能 =====
 
+    def _has_name_index(self) -> bool:
+        """
+        檢查藥名全文索引 drugs_fts 是否存在且可用（唯讀，不會建立索引）
+
+        說明:
+        - 索引由 scripts/create_name_index.py 明確建立
+        - 不存在或目前 SQLite 不支援 FTS5/trigram 時回傳 False，名稱搜尋退回 LIKE
+        - 結果快取至連線關閉為止
+
+        回傳:
+            bool: 是否可使用 drugs_fts
+        """
+        if self._name_index is not None:
+            return self._name_index
+
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'drugs_fts'"
+        )
+        self._name_index = cursor.fetchone() is not None
+        if self._name_index:
+            try:
+                # 虛擬表的模組不可用時（例如缺少 fts5），查詢會拋出 "no such module"
+                cursor.execute("SELECT 1 FROM drugs_fts LIMIT 0")
+            except sqlite3.Error as e:
+                print(f"⚠️  藥名全文索引無法使用，改用 LIKE 搜尋: {e}")
+                self._name_index = False
+        return self._name_index
+
+    def create_name_index(self) -> None:
+        """
+        建立藥名全文索引 drugs_fts（資料庫遷移，僅需執行一次）
+
+        說明:
+        - 建立 FTS5 trigram 虛擬表與三個同步觸發器，並以 'rebuild' 匯入現有資料
+        - 觸發器會隨 drugs 的寫入執行，所有會寫入資料庫的程式（包含 C# 管理工具）
+          使用的 SQLite 都必須支援 FTS5 與 trigram，否則寫入會失敗
+        - SQLite 不支援時拋出 sqlite3.Error，資料庫維持原狀
+        """
+        with self.conn:
+            for statement in _NAME_INDEX_STATEMENTS:
+                self.conn.execute(statement)
+        self._name_index = None
+
+    def drop_name_index(self) -> None:
+        """移除藥名全文索引 drugs_fts 與同步觸發器（名稱搜尋改回 LIKE）。"""
+
+        with self.conn:
+            for statement in _NAME_INDEX_DROP_STATEMENTS:
+                self.conn.execute(statement)
+        self._name_index = None
+
     def _normalize_search_query(self, query: str) -> List[str]:
         """
         正規化搜尋關鍵字，產生多個可能的字形變體
@@ -186,6 +298,7 @@ class DrugDatabase:
         - 搜尋中文名稱或英文名稱
         - 自動處理字形變體 (例如: 靈⇄林)
         - 使用 LIKE 模糊比對，支援部分匹配
+        - 關鍵字皆 >= 3 字時改由 drugs_fts 全文索引找出候選（結果與 LIKE 相同）
         - 依藥物 ID 排序，確保結果穩定
 
         參數:
@@ -208,10 +321,25 @@ class DrugDatabase:
         where_conditions = []
         params = []
 
-        for variant in search_variants:
-            where_conditions.append("d.chinese_name LIKE ?")
-            where_conditions.append("d.english_name LIKE ?")
-            params.extend([f"%{variant}%", f"%{variant}%"])
+        if (
+            all(len(variant) >= _NAME_INDEX_MIN_QUERY for variant in search_variants)
+            and self._has_name_index()
+        ):
+            # trigram 片語查詢即子字串比對（不分大小寫），同時涵蓋中英文名稱
+            where_conditions.append(
+                "d.id IN (SELECT rowid FROM drugs_fts WHERE drugs_fts MATCH ?)"
+            )
+            params.append(
+                " OR ".join(
+                    '"' + variant.replace('"', '""') + '"'
+                    for variant in search_variants
+                )
+            )
+        else:
+            for variant in search_variants:
+                where_conditions.append("d.chinese_name LIKE ?")
+                where_conditions.append("d.english_name LIKE ?")
+                params.extend([f"%{variant}%", f"%{variant}%"])
 
         # 建立 ORDER BY 條件 (完全匹配優先)
         order_conditions = []
@@ -358,6 +486,45 @@ class DrugDatabase:
 
         return [dict(row) for row in cursor.fetchall()]
 
+    def get_images_by_drug_ids(self, drug_ids: List[int]) -> Dict[int, List[Dict]]:
+        """
+        以單一 IN 查詢取得多個藥物的圖片
+
+        Args:
+            drug_ids: 藥物 ID 列表
+
+        Returns:
+            {藥物 ID: 圖片列表}，沒有圖片的藥物對應空列表
+        """
+        images = {drug_id: [] for drug_id in drug_ids}
+        if not images:
+            return images
+
+        cursor = self.conn.cursor()
+        placeholders = ",".join("?" * len(images))
+
+        cursor.execute(
+            f"""
+            SELECT 
+                drug_id,
+                id,
+                image_filename,
+                image_path,
+                image_order,
+                feature_vector
+            FROM drug_images
+            WHERE drug_id IN ({placeholders})
+            ORDER BY drug_id, image_order
+        """,
+            list(images),
+        )
+
+        for row in cursor.fetchall():
+            image = dict(row)
+            images[image.pop("drug_id")].append(image)
+
+        return images
+
     def get_all_drug_images(self) -> List[Dict]:
         """
         獲取所有藥物圖片（用於 AI 模型訓練或批量比對）
@@ -538,17 +705,9 @@ class DrugDatabase:
         cursor.execute("SELECT COUNT(*) as count FROM drugs")
         stats["total_drugs"] = cursor.fetchone()[0]
 
-        # 圖片總數
-        cursor.execute("SELECT COUNT(*) as count FROM drug_images")
-        stats["total_images"] = cursor.fetchone()[0]
-
-        # 有圖片的藥物數
-        cursor.execute(
-            """
-            SELECT COUNT(DISTINCT drug_id) as count FROM drug_images
-        """
-        )
-        stats["drugs_with_images"] = cursor.fetchone()[0]
+        # 圖片總數與有圖片的藥物數（同一次掃描算出兩個彙總）
+        cursor.execute("SELECT COUNT(*), COUNT(DISTINCT drug_id) FROM drug_images")
+        stats["total_images"], stats["drugs_with_images"] = cursor.fetchone()
 
         # 顏色分布
         cursor.execute(
@@ -28,7 +28,8 @@
 【技術規格】
 - OCR 引擎: PaddleOCR 3.3.0+
 - 語言支援: 繁體中文、英文
-- 辨識方向: 支援多角度文字 (angle_cls=True)
+- 辨識方向: 支援多角度文字 (fast_mode=False 時啟用方向分類)
+- 快速模式: 預設使用 PP-OCRv4 mobile 模型，偵測邊長 640、CPU 啟用 MKL-DNN
 
 【辨識流程】
 1. 上傳藥單/藥袋圖片
@@ -59,44 +60,331 @@
 ============================================================================
 """
 
-from typing import List, Dict, Optional, Tuple
+import functools
+import heapq
+import os
+import threading
+import time
+from operator import itemgetter
+from typing import List, Dict, Optional, Tuple, Union
 from pathlib import Path
+from difflib import SequenceMatcher
+
+import cv2
+import numpy as np
 from database_query import DrugDatabase
+from image_recognition import _decode_image
+
+try:
+    # rapidfuzz (可選)：C++ 實作的 Levenshtein 相似度，比 difflib 快數十倍
+    from rapidfuzz.fuzz import partial_ratio as fuzz_partial_ratio
+    from rapidfuzz.fuzz import ratio as fuzz_ratio
+    from rapidfuzz.process import cdist as fuzz_cdist
+except ImportError:
+    fuzz_ratio = fuzz_partial_ratio = fuzz_cdist = None
+
+# 名稱相似度下限（0-100）：低於此值視為不相符並回傳 0，rapidfuzz 可提前中止計算
+NAME_SIMILARITY_CUTOFF = 40
+
+# 單一藥名辨識時 OCR 文字的置信度下限
+SINGLE_NAME_MIN_CONFIDENCE = 0.5
+
+# 記憶體內藥名預篩的 partial_ratio 下限（0-100）
+NAME_PREFILTER_CUTOFF = 50
+
+# 名稱搜尋與圖片查詢快取的有效秒數：管理工具修改資料庫後，最多延遲這麼久才會反映
+SEARCH_CACHE_TTL = 60
+
+# OCR 輸入圖片長邊上限：手機照片（約 4000×3000）先縮小再交給 PaddleOCR，
+# 保留偵測上限 640 的兩倍，讓辨識模型裁切的文字行仍夠清晰
+OCR_MAX_SIDE = 1280
+
+# 已載入的 PaddleOCR 引擎（fast_mode -> 引擎），同一程序內的辨識器共用
+_ocr_engines: Dict[bool, object] = {}
+_ocr_engines_lock = threading.Lock()
+
+# 每個執行緒各自保留一條資料庫連線（sqlite3 連線不可跨執行緒使用），供快取未命中時查詢
+_thread_local = threading.local()
+
+
+def _get_database(db_path: str) -> DrugDatabase:
+    """取得目前執行緒對應 db_path 的長駐資料庫連線"""
+    databases = getattr(_thread_local, "databases", None)
+    if databases is None:
+        databases = _thread_local.databases = {}
+    db = databases.get(db_path)
+    if db is None:
+        db = databases[db_path] = DrugDatabase(db_path)
+        db.connect()
+    return db
+
+
+def _close_database(db_path: str) -> None:
+    """關閉目前執行緒對應 db_path 的長駐資料庫連線（之後查詢會自動重新連線）"""
+    db = getattr(_thread_local, "databases", {}).pop(db_path, None)
+    if db is not None:
+        db.close()
+
+
+# clear_search_cache() 的呼叫次數，納入快取世代使所有快取立即失效
+_cache_generation = 0
+
+
+def _cache_epoch() -> Tuple[int, int]:
+    """
+    目前的快取世代 (手動清除次數, 時間區段)
+
+    時間區段每 SEARCH_CACHE_TTL 秒遞增；以此為鍵的快取在世代改變後不再命中
+    （LRU 快取的舊項目由 LRU 淘汰，記憶體內藥名索引則重新載入）。
+    """
+    return _cache_generation, int(time.monotonic() // SEARCH_CACHE_TTL)
+
+
+@functools.lru_cache(maxsize=512)
+def _cached_search(
+    db_path: str, text: str, limit: int, epoch: Tuple[int, int]
+) -> Tuple[Dict, ...]:
+    """名稱搜尋的 LRU 快取本體（epoch 為 _cache_epoch()，僅作為快取鍵）"""
+    return tuple(_get_database(db_path).search_by_name(text, limit=limit))
+
+
+@functools.lru_cache(maxsize=512)
+def _cached_images(
+    db_path: str, drug_ids: Tuple[int, ...], epoch: Tuple[int, int]
+) -> Dict[int, Tuple[Dict, ...]]:
+    """圖片查詢的 LRU 快取本體（epoch 為 _cache_epoch()，僅作為快取鍵）"""
+    images = _get_database(db_path).get_images_by_drug_ids(list(drug_ids))
+    return {drug_id: tuple(rows) for drug_id, rows in images.items()}
+
+
+def _search_by_name(db_path: str, text: str, limit: int) -> List[Dict]:
+    """
+    以名稱搜尋藥物（快取最多保留 SEARCH_CACHE_TTL 秒）
+
+    說明:
+    - 藥單中常重複出現相同文字（如「錠」、「mg」），命中時不必再查詢 SQLite
+    - 回傳快取內容的複本，呼叫端修改結果不會影響快取
+    - 需要立即反映資料庫變更時可呼叫 clear_search_cache()
+    """
+    return [dict(drug) for drug in _cached_search(db_path, text, limit, _cache_epoch())]
+
+
+def _images_by_drug_ids(
+    db_path: str, drug_ids: Tuple[int, ...]
+) -> Dict[int, List[Dict]]:
+    """一次取得多個藥物的所有圖片（單一 IN 查詢，快取規則同 _search_by_name，回傳複本）"""
+    images = _cached_images(db_path, drug_ids, _cache_epoch())
+    return {
+        drug_id: [dict(image) for image in rows] for drug_id, rows in images.items()
+    }
+
+
+def clear_search_cache() -> None:
+    """清除名稱搜尋、圖片查詢與記憶體內藥名索引的快取（資料庫內容更新後呼叫）"""
+    global _cache_generation
+    _cache_generation += 1
+    _cached_search.cache_clear()
+    _cached_images.cache_clear()
+
+
+@functools.lru_cache(maxsize=4096)
+def _normalize_name(text: str) -> str:
+    """
+    名稱正規化：轉小寫並移除空白（含全形空白、Tab）
+
+    說明:
+    - LRU 快取：同一 OCR 文字與資料庫藥名在比對迴圈中反覆出現，命中時不再產生新字串
+    - 未命中時 lower()/replace() 鏈比 dict 對照表的 str.translate 快數倍（後者走逐字元慢速路徑）
+    """
+    return text.lower().replace(" ", "").replace("\t", "").replace("\u3000", "")
+
+
+@functools.lru_cache(maxsize=4096)
+def _char_bits(text: str) -> int:
+    """
+    將字串的字元集合壓成 1024 位元的位元圖（碼位取低 10 位元，LRU 快取）
+
+    說明:
+    - 兩字串位元圖 AND 為 0 時必定沒有共同字元（碰撞只會多出位元，不會漏判）
+    - 資料庫藥名反覆出現，命中快取後每次比對只需計算 OCR 文字
+    """
+    bits = 0
+    for char in text:
+        bits |= 1 << (ord(char) & 1023)
+    return bits
+
+
+def _prepare_image(
+    image: Union[str, Path, np.ndarray], max_side: int = OCR_MAX_SIDE
+) -> Optional[np.ndarray]:
+    """
+    讀取並縮小 OCR 輸入圖片
+
+    說明:
+    - 由 image_recognition._decode_image 解碼，JPEG 在長邊仍 >= max_side 時直接縮小解碼
+    - 最後以 INTER_AREA 縮到長邊 max_side（已夠小的圖片不放大）
+
+    Args:
+        image: 圖片路徑或 BGR 陣列
+        max_side: 長邊上限
+
+    Returns:
+        BGR 圖片陣列，讀取失敗返回 None
+    """
+    if isinstance(image, np.ndarray):
+        img = image
+    else:
+        # np.fromfile + imdecode 可讀取含中文的路徑
+        try:
+            data = np.fromfile(str(image), dtype=np.uint8)
+        except OSError:
+            return None
+        img = _decode_image(data, min_long_side=max_side)
+        if img is None:
+            return None
+
+    scale = max_side / max(img.shape[:2])
+    if scale < 1:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return img
+
+
+def _gpu_available() -> bool:
+    """檢查 PaddlePaddle 是否為 CUDA 版本且偵測得到 GPU"""
+    try:
+        import paddle
+
+        return (
+            paddle.device.is_compiled_with_cuda()
+            and paddle.device.cuda.device_count() > 0
+        )
+    except Exception:
+        return False
+
+
+def _create_ocr_engine(fast_mode: bool):
+    """
+    建立 PaddleOCR 引擎（偵測到 GPU 時優先使用 TensorRT FP16，失敗則退回 CPU）
+
+    Args:
+        fast_mode: 是否使用快速模式
+
+    Returns:
+        PaddleOCR 實例，未安裝或初始化失敗返回 None
+    """
+    try:
+        from paddleocr import PaddleOCR
+    except ImportError:
+        print("⚠️  PaddleOCR 未安裝，請執行：pip install paddleocr paddlepaddle")
+        return None
+
+    # 初始化 OCR（使用繁體中文模型）
+    # 注意：PaddleOCR 3.x 版本移除了 use_gpu 和 show_log 參數，以下使用 3.x 參數名稱
+    if fast_mode:
+        # 快速模式：mobile 偵測/辨識模型、偵測邊長上限 640（卷積運算量與邊長平方成正比）；
+        # 方向分類模型很小，仍先載入，推論時預設關閉（rotated=True 時才逐次啟用）
+        options = dict(
+            text_detection_model_name="PP-OCRv4_mobile_det",
+            text_recognition_model_name="PP-OCRv4_mobile_rec",
+            use_textline_orientation=True,
+            text_det_limit_side_len=640,
+        )
+    else:
+        options = dict(
+            lang="ch",  # 中文模型（支援繁體）
+            ocr_version="PP-OCRv5",
+            use_textline_orientation=True,  # 使用方向分類
+        )
+    # 辨識批次 16：同一張圖的文字行合併推論
+    options["text_recognition_batch_size"] = 16
+
+    # 裝置設定：GPU 使用 TensorRT FP16（記憶體頻寬減半、可用 Tensor Core），CPU 啟用 MKL-DNN
+    devices = []
+    if _gpu_available():
+        devices.append(
+            ("GPU", dict(device="gpu:0", use_tensorrt=True, precision="fp16"))
+        )
+    devices.append(
+        (
+            "CPU",
+            dict(
+                device="cpu",
+                enable_mkldnn=True,
+                cpu_threads=max(1, (os.cpu_count() or 2) // 2),
+            ),
+        )
+    )
+
+    for name, device_options in devices:
+        try:
+            ocr = PaddleOCR(**options, **device_options)
+            if name == "GPU":
+                # 先跑一次空白圖，讓 TensorRT 在初始化階段建好引擎，第一個請求不必等待
+                ocr.predict(np.zeros((640, 640, 3), dtype=np.uint8))
+            print(
+                f"✅ PaddleOCR 初始化成功（{'快速' if fast_mode else '高精度'}模式，{name}）"
+            )
+            return ocr
+        except Exception as e:
+            print(f"⚠️  PaddleOCR 初始化失敗（{name}）: {e}")
+    return None
+
+
+def _get_ocr_engine(fast_mode: bool):
+    """
+    取得程序內共用的 PaddleOCR 引擎（依模式各載入一次）
+
+    說明:
+    - 模型載入需數秒、佔用數百 MB，重複建立 DrugOCRRecognizer 時直接沿用已載入的引擎
+    - 初始化失敗不快取，下次建立辨識器時會重試
+    """
+    with _ocr_engines_lock:
+        engine = _ocr_engines.get(fast_mode)
+        if engine is None:
+            engine = _create_ocr_engine(fast_mode)
+            if engine is not None:
+                _ocr_engines[fast_mode] = engine
+        return engine
 
 
 class DrugOCRRecognizer:
     """藥單 OCR 辨識器"""
 
-    def __init__(self, db_path: str = "drug_recognition.db"):
+    def __init__(self, db_path: str = "drug_recognition.db", fast_mode: bool = True):
+        """
+        Args:
+            db_path: 資料庫路徑
+            fast_mode: True 使用 PP-OCRv4 輕量模型、不做文字方向分類（CPU 延遲約降 1.5-3 倍）；
+                       False 使用 PP-OCRv5 模型並啟用方向分類（適合旋轉拍攝的藥袋）
+        """
         self.db_path = db_path
+        self.fast_mode = fast_mode
+        # 是否對每行文字執行方向分類（拍正的藥單不需要，快速模式預設關閉）
+        self.use_cls = not fast_mode
         self.ocr = None
+        # 記憶體內藥名索引: (快取世代, 藥品資料, 正規化名稱)，首次單一藥名辨識時才載入，
+        # 世代改變（逾 SEARCH_CACHE_TTL 秒或呼叫 clear_search_cache()）時重新載入
+        self._drug_names: Optional[Tuple[Tuple[int, int], List[Dict], List[str]]] = None
+        self._names_lock = threading.Lock()
         self._init_ocr()
 
     def _init_ocr(self):
-        """初始化 PaddleOCR"""
-        try:
-            from paddleocr import PaddleOCR
+        """取得 PaddleOCR 引擎（同一程序內相同模式的辨識器共用已載入的模型）"""
+        self.ocr = _get_ocr_engine(self.fast_mode)
 
-            # 初始化 OCR（使用繁體中文模型）
-            # 注意：PaddleOCR 3.x 版本移除了 use_gpu 和 show_log 參數
-            self.ocr = PaddleOCR(
-                use_angle_cls=True,  # 使用方向分類
-                lang="ch",  # 中文模型（支援繁體）
-            )
-            print("✅ PaddleOCR 初始化成功")
-        except ImportError:
-            print("⚠️  PaddleOCR 未安裝，請執行：pip install paddleocr paddlepaddle")
-            self.ocr = None
-        except Exception as e:
-            print(f"⚠️  PaddleOCR 初始化失敗: {e}")
-            self.ocr = None
+    def close(self):
+        """關閉目前執行緒保留的資料庫連線"""
+        _close_database(self.db_path)
 
-    def extract_text(self, image_path: str) -> List[Tuple[str, float]]:
+    def extract_text(
+        self, image_path: Union[str, np.ndarray], use_cls: Optional[bool] = None
+    ) -> List[Tuple[str, float]]:
         """
-        從圖片中提取文字
+        從圖片中提取文字（先縮小至長邊 OCR_MAX_SIDE 再推論）
 
         Args:
-            image_path: 圖片路徑
+            image_path: 圖片路徑或 BGR 陣列
+            use_cls: 是否執行文字方向分類，None 表示使用 self.use_cls
 
         Returns:
             [(文字, 置信度)] 列表
@@ -105,8 +393,25 @@ class DrugOCRRecognizer:
             return []
 
         try:
-            # 執行 OCR
-            result = self.ocr.ocr(image_path, cls=True)
+            image = _prepare_image(image_path)
+            if image is None:
+                print(f"❌ 無法讀取圖片: {image_path}")
+                return []
+
+            if use_cls is None:
+                use_cls = self.use_cls
+
+            # PaddleOCR 3.x：predict 回傳每張圖片一筆結果（rec_texts / rec_scores）
+            if hasattr(self.ocr, "predict"):
+                result = self.ocr.predict(image, use_textline_orientation=use_cls)
+                if not result:
+                    return []
+                return list(
+                    zip(result[0]["rec_texts"], map(float, result[0]["rec_scores"]))
+                )
+
+            # 舊版介面：每行為 [座標, (文字, 置信度)]
+            result = self.ocr.ocr(image, cls=use_cls)
 
             if not result or not result[0]:
                 return []
@@ -123,8 +428,52 @@ class DrugOCRRecognizer:
             print(f"OCR 提取失敗: {e}")
             return []
 
+    def extract_text_batch(
+        self, image_paths: List[str], use_cls: Optional[bool] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        一次從多張圖片中提取文字（批次推論）
+
+        說明:
+        - PaddleOCR 3.x 的 predict() 可直接接受路徑列表，偵測/辨識模型會合併批次執行，
+          攤平每張圖片的模型呼叫與 Python↔C 往返成本
+        - 各圖片同樣先縮小至長邊 OCR_MAX_SIDE
+        - 舊版（沒有 predict）、有圖片讀取失敗或批次失敗時退回逐張 extract_text
+
+        Args:
+            image_paths: 圖片路徑列表
+            use_cls: 是否執行文字方向分類，None 表示使用 self.use_cls
+
+        Returns:
+            與 image_paths 對應的 [(文字, 置信度)] 列表
+        """
+        if self.ocr is None:
+            return [[] for _ in image_paths]
+        if not image_paths:
+            return []
+
+        predict = getattr(self.ocr, "predict", None)
+        if predict is not None:
+            images = [_prepare_image(path) for path in image_paths]
+            if all(image is not None for image in images):
+                try:
+                    return [
+                        list(zip(res["rec_texts"], map(float, res["rec_scores"])))
+                        for res in predict(
+                            images,
+                            use_textline_orientation=(
+                                self.use_cls if use_cls is None else use_cls
+                            ),
+                        )
+                    ]
+                except Exception as e:
+                    print(f"OCR 批次提取失敗，改為逐張處理: {e}")
+                return [self.extract_text(image, use_cls) for image in images]
+
+        return [self.extract_text(path, use_cls) for path in image_paths]
+
     def recognize_prescription(
-        self, image_path: str, confidence_threshold: float = 0.7
+        self, image_path: str, confidence_threshold: float = 0.7, rotated: bool = False
     ) -> Dict:
         """
         辨識藥單（處方籤）
@@ -132,6 +481,7 @@ class DrugOCRRecognizer:
         Args:
             image_path: 藥單圖片路徑
             confidence_threshold: 置信度閾值（低於此值的文字會被過濾）
+            rotated: 藥單/藥袋歪斜或倒置拍攝時設為 True，強制執行文字方向分類
 
         Returns:
             辨識結果
@@ -140,7 +490,43 @@ class DrugOCRRecognizer:
             return {"success": False, "message": "OCR 模組未初始化，請安裝 paddleocr"}
 
         # 提取文字
-        texts = self.extract_text(image_path)
+        texts = self.extract_text(image_path, use_cls=True if rotated else None)
+        return self._match_prescription_texts(texts, confidence_threshold)
+
+    def recognize_prescriptions(
+        self,
+        image_paths: List[str],
+        confidence_threshold: float = 0.7,
+        rotated: bool = False,
+    ) -> List[Dict]:
+        """
+        批次辨識多張藥單（OCR 只執行一次批次推論）
+
+        Args:
+            image_paths: 藥單圖片路徑列表
+            confidence_threshold: 置信度閾值（低於此值的文字會被過濾）
+            rotated: 同 recognize_prescription
+
+        Returns:
+            與 image_paths 對應的辨識結果列表（格式同 recognize_prescription）
+        """
+        if self.ocr is None:
+            return [
+                {"success": False, "message": "OCR 模組未初始化，請安裝 paddleocr"}
+                for _ in image_paths
+            ]
+
+        return [
+            self._match_prescription_texts(texts, confidence_threshold)
+            for texts in self.extract_text_batch(
+                image_paths, use_cls=True if rotated else None
+            )
+        ]
+
+    def _match_prescription_texts(
+        self, texts: List[Tuple[str, float]], confidence_threshold: float
+    ) -> Dict:
+        """將 OCR 文字與資料庫藥物名稱比對，組成藥單辨識結果。"""
 
         if not texts:
             return {"success": False, "message": "未能從圖片中識別文字"}
@@ -154,34 +540,37 @@ class DrugOCRRecognizer:
         matched_drugs = []
         all_detected_texts = []
 
-        with DrugDatabase(self.db_path) as db:
-            for text, confidence in filtered_texts:
-                all_detected_texts.append(
-                    {"text": text, "confidence": f"{confidence * 100:.1f}%"}
-                )
+        for text, confidence in filtered_texts:
+            all_detected_texts.append(
+                {"text": text, "confidence": f"{confidence * 100:.1f}%"}
+            )
 
-                # 搜尋包含此文字的藥物
-                results = db.search_by_name(text, limit=3)
-
-                for drug in results:
-                    # 檢查是否已存在
-                    if not any(m["id"] == drug["id"] for m in matched_drugs):
-                        # 補充圖片資訊
-                        images = db.get_drug_images(drug["id"])
-                        matched_drugs.append(
-                            {
-                                "id": drug["id"],
-                                "chinese_name": drug["chinese_name"],
-                                "english_name": drug["english_name"],
-                                "license_number": drug["license_number"],
-                                "shape": drug["shape"],
-                                "color": drug["color"],
-                                "special_dosage_form": drug["special_dosage_form"],
-                                "matched_text": text,
-                                "ocr_confidence": f"{confidence * 100:.1f}%",
-                                "images": images,
-                            }
-                        )
+            # 搜尋包含此文字的藥物（相同文字的查詢結果會被快取）
+            results = _search_by_name(self.db_path, text, 3)
+
+            for drug in results:
+                # 檢查是否已存在
+                if not any(m["id"] == drug["id"] for m in matched_drugs):
+                    matched_drugs.append(
+                        {
+                            "id": drug["id"],
+                            "chinese_name": drug["chinese_name"],
+                            "english_name": drug["english_name"],
+                            "license_number": drug["license_number"],
+                            "shape": drug["shape"],
+                            "color": drug["color"],
+                            "special_dosage_form": drug["special_dosage_form"],
+                            "matched_text": text,
+                            "ocr_confidence": f"{confidence * 100:.1f}%",
+                        }
+                    )
+
+        # 補充圖片資訊（所有比對到的藥物合併為一次查詢）
+        images = _images_by_drug_ids(
+            self.db_path, tuple(m["id"] for m in matched_drugs)
+        )
+        for match in matched_drugs:
+            match["images"] = images[match["id"]]
 
         return {
             "success": True,
@@ -191,6 +580,86 @@ class DrugOCRRecognizer:
             "matched_drugs": matched_drugs,
         }
 
+    def _load_drug_names(self) -> Tuple[List[Dict], List[str]]:
+        """
+        取得記憶體內藥名索引（藥品資料, 正規化名稱），藥名比對不再逐筆查詢 SQLite
+
+        說明:
+        - 快取規則同 _search_by_name：世代改變後重新載入，資料庫的修改最多延遲
+          SEARCH_CACHE_TTL 秒反映
+        - 兩者以同一個 tuple 保存並一起替換，比對時不會混用新舊資料
+        """
+        epoch = _cache_epoch()
+        names = self._drug_names
+        if names is not None and names[0] == epoch:
+            return names[1], names[2]
+
+        with self._names_lock:
+            names = self._drug_names
+            if names is not None and names[0] == epoch:
+                return names[1], names[2]
+
+            cursor = _get_database(self.db_path).conn.execute(
+                """
+                SELECT id, license_number, chinese_name, english_name,
+                       shape, color, special_dosage_form
+                FROM drugs
+                ORDER BY chinese_name
+                """
+            )
+            rows = [dict(row) for row in cursor.fetchall()]
+
+            # 前半段為中文名、後半段為英文名，索引 j 對應 rows[j % len(rows)]
+            choices = [
+                _normalize_name(row[key] or "")
+                for key in ("chinese_name", "english_name")
+                for row in rows
+            ]
+            if names is None:
+                print(f"✅ 已載入 {len(rows)} 筆藥名至記憶體索引")
+            self._drug_names = (epoch, rows, choices)
+            return rows, choices
+
+    def _search_drug_names(self, text: str, limit: int) -> List[Dict]:
+        """
+        以 rapidfuzz partial_ratio 在記憶體內比對藥名（未安裝 rapidfuzz 時退回 SQLite LIKE 查詢）
+
+        Args:
+            text: OCR 文字
+            limit: 最多回傳筆數
+
+        Returns:
+            依相似度排序的藥品資料
+        """
+        if fuzz_cdist is None:
+            return _search_by_name(self.db_path, text, limit)
+
+        rows, choices = self._load_drug_names()
+        if not rows:
+            return []
+
+        # 沿用資料庫查詢的正規化變體（靈⇄林 等常見 OCR 誤判）
+        variants = [
+            _normalize_name(variant)
+            for variant in _get_database(self.db_path)._normalize_search_query(text)
+        ]
+        variants = [variant for variant in variants if variant]
+        if not variants:
+            return []
+
+        # (變體數, 2N) 分數矩陣 → 每個名稱取最佳變體 → 每個藥品取中/英文名較高者
+        scores = fuzz_cdist(
+            variants,
+            choices,
+            scorer=fuzz_partial_ratio,
+            score_cutoff=NAME_PREFILTER_CUTOFF,
+        ).max(axis=0)
+        scores = scores.reshape(2, len(rows)).max(axis=0)
+
+        # 穩定排序：同分時維持載入時的中文名順序
+        order = np.argsort(-scores, kind="stable")[:limit]
+        return [dict(rows[i]) for i in order if scores[i] > 0]
+
     def recognize_single_drug_name(self, image_path: str) -> Dict:
         """
         辨識單一藥物名稱（藥袋、藥盒照片）
@@ -207,60 +676,74 @@ class DrugOCRRecognizer:
         if not texts:
             return {"success": False, "message": "未能識別文字"}
 
-        # 取置信度最高的幾個文字
-        top_texts = sorted(texts, key=lambda x: x[1], reverse=True)[:5]
+        # 取置信度最高的幾個文字（先濾掉低置信度，再以 heap 取前 5，不必排序全部）
+        texts = [t for t in texts if t[1] >= SINGLE_NAME_MIN_CONFIDENCE]
+        top_texts = heapq.nlargest(5, texts, key=itemgetter(1))
 
-        # 搜尋藥物
-        all_matches = []
+        # 搜尋藥物：候選以平行陣列暫存，最後才組成完整結果
+        drugs, matched_texts, confidences, name_scores = [], [], [], []
 
-        with DrugDatabase(self.db_path) as db:
-            for text, confidence in top_texts:
-                results = db.search_by_name(text, limit=5)
+        for text, confidence in top_texts:
+            results = self._search_drug_names(text, 5)
 
-                for drug in results:
-                    # 計算綜合相似度（OCR 置信度 + 名稱匹配度）
-                    name_match_score = self._calculate_name_similarity(
-                        text, drug["chinese_name"]
-                    )
-                    overall_score = 0.6 * confidence + 0.4 * name_match_score
+            for drug in results:
+                drugs.append(drug)
+                matched_texts.append(text)
+                confidences.append(confidence)
+                name_scores.append(
+                    self._calculate_name_similarity(text, drug["chinese_name"])
+                )
 
-                    images = db.get_drug_images(drug["id"])
+        # 綜合相似度（OCR 置信度 + 名稱匹配度）一次以向量運算求出
+        scores = 0.6 * np.array(confidences, dtype=np.float64) + 0.4 * np.array(
+            name_scores, dtype=np.float64
+        )
 
-                    all_matches.append(
-                        {
-                            "id": drug["id"],
-                            "chinese_name": drug["chinese_name"],
-                            "english_name": drug["english_name"],
-                            "license_number": drug["license_number"],
-                            "shape": drug["shape"],
-                            "color": drug["color"],
-                            "matched_text": text,
-                            "ocr_confidence": f"{confidence * 100:.1f}%",
-                            "similarity": overall_score,
-                            "similarity_percent": f"{overall_score * 100:.1f}%",
-                            "images": images,
-                        }
-                    )
+        # 去重並排序：依分數穩定排序後，每個藥物 ID 只保留第一次出現（最高分）
+        ids = np.array([drug["id"] for drug in drugs], dtype=np.int64)
+        order = np.argsort(-scores, kind="stable")
+        _, first_idx = np.unique(ids[order], return_index=True)
+        keep = order[np.sort(first_idx)[:5]]
 
-        # 去重並排序
+        # 只替最終保留的藥物查詢圖片（合併為一次查詢）
+        images = _images_by_drug_ids(self.db_path, tuple(int(ids[i]) for i in keep))
         unique_matches = []
-        seen_ids = set()
-
-        for match in sorted(all_matches, key=lambda x: x["similarity"], reverse=True):
-            if match["id"] not in seen_ids:
-                unique_matches.append(match)
-                seen_ids.add(match["id"])
+        for i in keep:
+            drug, confidence = drugs[i], confidences[i]
+            overall_score = float(scores[i])
+            unique_matches.append(
+                {
+                    "id": drug["id"],
+                    "chinese_name": drug["chinese_name"],
+                    "english_name": drug["english_name"],
+                    "license_number": drug["license_number"],
+                    "shape": drug["shape"],
+                    "color": drug["color"],
+                    "matched_text": matched_texts[i],
+                    "ocr_confidence": f"{confidence * 100:.1f}%",
+                    "similarity": overall_score,
+                    "similarity_percent": f"{overall_score * 100:.1f}%",
+                    "images": images[drug["id"]],
+                }
+            )
 
         return {
             "success": True,
             "method": "OCR",
-            "count": len(unique_matches),
-            "data": unique_matches[:5],  # 返回前 5 個
+            "count": len(first_idx),
+            "data": unique_matches,  # 返回前 5 個
         }
 
     def _calculate_name_similarity(self, text1: str, text2: str) -> float:
         """
-        計算兩個字串的相似度（簡單版本）
+        計算兩個字串的相似度
+
+        說明:
+        - 互相包含時固定回傳 0.9
+        - 其餘以編輯距離相似度計算（考慮字元順序，不像字元集合重疊會被共用部首誤導）
+        - 沒有任何共同字元（位元圖 AND 為 0）時直接回傳 0
+        - 長度差過大時直接回傳 0（ratio 上限為 2·min(L1, L2) / (L1 + L2)，不必計算編輯距離）
+        - 有安裝 rapidfuzz 時使用 C++ 實作並帶入 score_cutoff，否則退回 difflib
 
         Args:
             text1: 字串 1
@@ -273,24 +756,31 @@ class DrugOCRRecognizer:
             return 0.0
 
         # 轉為小寫並移除空白
-        t1 = text1.lower().replace(" ", "")
-        t2 = text2.lower().replace(" ", "")
+        t1 = _normalize_name(text1)
+        t2 = _normalize_name(text2)
 
         # 子字串包含檢查
         if t1 in t2 or t2 in t1:
             return 0.9
 
-        # 簡單字元重疊率
-        set1 = set(t1)
-        set2 = set(t2)
+        if not t1 or not t2:
+            return 0.0
 
-        if not set1 or not set2:
+        # 沒有共同字元時編輯距離相似度必為 0
+        if not _char_bits(t1) & _char_bits(t2):
             return 0.0
 
-        intersection = len(set1 & set2)
-        union = len(set1 | set2)
+        # 長度下限：即使較短字串完全對上，相似度也達不到門檻
+        len1, len2 = len(t1), len(t2)
+        if 200 * min(len1, len2) < NAME_SIMILARITY_CUTOFF * (len1 + len2):
+            return 0.0
 
-        return intersection / union if union > 0 else 0.0
+        # 編輯距離相似度，低於下限視為不相符
+        if fuzz_ratio is not None:
+            return fuzz_ratio(t1, t2, score_cutoff=NAME_SIMILARITY_CUTOFF) / 100.0
+
+        score = SequenceMatcher(None, t1, t2).ratio()
+        return score if score * 100 >= NAME_SIMILARITY_CUTOFF else 0.0
 
 
 def test_ocr():
@@ -306,14 +796,20 @@ def test_ocr():
         print("   pip install paddleocr paddlepaddle")
         return
 
-    # 尋找測試圖片
-    test_images = list(Path("medicine_photos").glob("*.jpg"))[:1]
+    # 尋找測試圖片（單次 os.scandir，找到第一張 .jpg 即停止，不必列出整個資料夾）
+    photo_dir = Path("medicine_photos")
+    test_image = None
+    if photo_dir.is_dir():
+        with os.scandir(photo_dir) as entries:
+            test_image = next(
+                (entry.path for entry in entries if entry.name.endswith(".jpg")),
+                None,
+            )
 
-    if not test_images:
+    if test_image is None:
         print("⚠️  沒有測試圖片")
         return
 
-    test_image = str(test_images[0])
     print(f"\n📸 測試圖片: {test_image}")
     print("-" * 50)
 
@@ -323,10 +819,13 @@ def test_ocr():
     if result["success"]:
         print(f"✅ 辨識成功，找到 {result['count']} 個匹配")
         for i, drug in enumerate(result["data"][:3], 1):
-            print(f"\n第 {i} 名：")
-            print(f"  藥物名稱：{drug['chinese_name']}")
-            print(f"  匹配文字：{drug['matched_text']}")
-            print(f"  相似度：{drug['similarity_percent']}")
+            # 每筆結果組成一個字串後一次輸出
+            print(
+                f"\n第 {i} 名：\n"
+                f"  藥物名稱：{drug['chinese_name']}\n"
+                f"  匹配文字：{drug['matched_text']}\n"
+                f"  相似度：{drug['similarity_percent']}"
+            )
     else:
         print(f"❌ 辨識失敗：{result.get('message', '未知錯誤')}")
 
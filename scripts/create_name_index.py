@@ -0,0 +1,66 @@
+"""
+============================================================================
+藥物辨識系統 - 藥名全文索引遷移工具 (create_name_index.py)
+============================================================================
+
+【檔案功能】
+為 drugs 資料表建立 FTS5 trigram 全文索引 drugs_fts，讓名稱搜尋的
+'%關鍵字%' 子字串查詢改走倒排索引。索引不存在時 search_by_name 會自動
+使用 LIKE 掃描，因此這個遷移是選用的，且只需執行一次。
+
+【注意事項】
+- 需要 SQLite 3.34 以上並啟用 FTS5（trigram 斷詞）
+- 建立後 drugs 上會有三個同步觸發器，所有寫入資料庫的程式
+  （包含 C# 管理工具）使用的 SQLite 也必須支援 FTS5/trigram，
+  否則寫入 drugs 會出現 "no such module" 錯誤
+- 發生上述問題時可用 --drop 移除索引與觸發器
+
+【使用方式】
+   python create_name_index.py                 # 建立索引（預設專案根目錄的資料庫）
+   python create_name_index.py --db path.db    # 指定資料庫
+   python create_name_index.py --drop          # 移除索引與觸發器
+============================================================================
+"""
+
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from database_query import DrugDatabase  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="建立或移除藥名全文索引 drugs_fts")
+    parser.add_argument(
+        "--db",
+        default=str(PROJECT_ROOT / "drug_recognition.db"),
+        help="SQLite 資料庫路徑（預設為專案根目錄的 drug_recognition.db）",
+    )
+    parser.add_argument("--drop", action="store_true", help="移除索引與同步觸發器")
+    args = parser.parse_args()
+
+    if not Path(args.db).exists():
+        print(f"❌ 找不到資料庫: {args.db}")
+        return 1
+
+    print(f"SQLite 版本: {sqlite3.sqlite_version}")
+    with DrugDatabase(args.db) as db:
+        try:
+            if args.drop:
+                db.drop_name_index()
+                print("✅ 已移除藥名全文索引 drugs_fts 與同步觸發器")
+            else:
+                db.create_name_index()
+                print("✅ 已建立藥名全文索引 drugs_fts")
+        except sqlite3.Error as e:
+            print(f"❌ 操作失敗，資料庫未變更: {e}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
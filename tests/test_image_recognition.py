@@ -0,0 +1,103 @@
+"""
+image_recognition 形狀特徵回歸測試
+
+說明: 同一顆藥物以資料庫尺寸 (600x800) 與相機尺寸 (1200x1600) 拍攝，平均形狀相似度需 >= 0.95
+
+執行方式: python -m unittest discover tests
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_recognition import DrugImageRecognizer  # noqa: E402
+
+# (形狀, 半軸長 (x, y))，以 600x800 為基準
+PILL_SHAPES = {
+    "circle": (170, 170),
+    "ellipse": (250, 150),
+    "oblong": (300, 110),
+}
+NOISE_SEEDS = range(8)
+CAMERA_SCALE = 2.0
+
+
+def render_pill(axes, scale, seed):
+    """繪製邊緣略為失焦、帶感光雜訊的合成藥物照片（scale=1 為 600x800）。"""
+
+    height, width = int(600 * scale), int(800 * scale)
+    img = np.full((height, width, 3), (200, 200, 205), np.uint8)
+    center = (width // 2, height // 2)
+    cv2.ellipse(
+        img,
+        center,
+        (int(axes[0] * scale), int(axes[1] * scale)),
+        0,
+        0,
+        360,
+        (200, 90, 40),
+        -1,
+        cv2.LINE_AA,
+    )
+    img = cv2.GaussianBlur(img, (0, 0), 2 * scale)
+    noise = np.random.default_rng(seed).integers(-10, 10, img.shape)
+    return np.clip(img.astype(int) + noise, 0, 255).astype(np.uint8)
+
+
+class ShapeFeatureRegressionTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp_dir = Path(self._tmp.name)
+        self.recognizer = DrugImageRecognizer(
+            db_path=str(self.tmp_dir / "missing.db"),
+            photo_dir=str(self.tmp_dir),
+            cache_dir=str(self.tmp_dir / "feature_cache"),
+        )
+        # 資料庫不存在，背景預載會立即結束；等它結束以免與測試競爭
+        self.recognizer._load_thread.join()
+
+    def tearDown(self):
+        self.recognizer.close()
+        self._tmp.cleanup()
+
+    def _shape_vector(self, name, axes, scale, seed):
+        """將合成照片寫成 JPEG，經資料庫特徵管線取得形狀向量。"""
+
+        path = self.tmp_dir / f"{name}.jpg"
+        ok, buf = cv2.imencode(
+            ".jpg", render_pill(axes, scale, seed), [cv2.IMWRITE_JPEG_QUALITY, 90]
+        )
+        self.assertTrue(ok)
+        buf.tofile(str(path))
+        features = self.recognizer._get_or_compute_features(
+            {"image_filename": path.name, "image_path": str(path)}
+        )
+        self.assertIsNotNone(features)
+        return features[1]
+
+    def test_shape_vector_is_stable_across_capture_sizes(self):
+        similarities = []
+        for seed in NOISE_SEEDS:
+            for shape, axes in PILL_SHAPES.items():
+                db_shape = self._shape_vector(f"{shape}_{seed}_db", axes, 1.0, seed)
+                camera_shape = self._shape_vector(
+                    f"{shape}_{seed}_camera", axes, CAMERA_SCALE, seed
+                )
+                similarities.append(
+                    float(
+                        self.recognizer.calculate_shape_similarity(
+                            db_shape, camera_shape
+                        )
+                    )
+                )
+        self.assertGreaterEqual(float(np.mean(similarities)), 0.95)
+
+
+if __name__ == "__main__":
+    unittest.main()
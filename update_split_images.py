@@ -69,32 +69,84 @@
 """
 
 import sqlite3
-from pathlib import Path
 import os
 
+# 藥物圖片資料夾
+PHOTO_DIR = "medicine_photos"
 
-def update_database_for_split_images():
+# 開啟連線時套用的 PRAGMA：WAL + NORMAL 同步、暫存表放記憶體
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+# drug_images 索引：依檔名查詢記錄、依 drug_id 分組統計
+DRUG_IMAGE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_drug_images_filename ON drug_images(image_filename)",
+    "CREATE INDEX IF NOT EXISTS idx_drug_images_drugid ON drug_images(drug_id)",
+)
+
+
+def _ensure_indexes(cursor: sqlite3.Cursor) -> None:
+    """建立 drug_images 索引（已存在時略過）"""
+    for statement in DRUG_IMAGE_INDEXES:
+        cursor.execute(statement)
+
+
+def _scan_filenames(photo_dir: str) -> dict:
+    """
+    以單次 os.scandir 取得資料夾內所有檔案名稱（資料夾不存在時回傳空字典）
+
+    回傳:
+        dict: 小寫檔名 -> 原始檔名；Windows 檔名不分大小寫，比對一律使用小寫檔名
+    """
+    if not os.path.isdir(photo_dir):
+        return {}
+    with os.scandir(photo_dir) as entries:
+        return {entry.name.lower(): entry.name for entry in entries if entry.is_file()}
+
+
+def _count_records(by_name: dict, drug_id: int, *filenames: str) -> int:
+    """計算預先載入的記錄中，指定藥物下符合檔名的記錄數"""
+    return sum(
+        record_drug_id == drug_id
+        for filename in filenames
+        for _, record_drug_id in by_name.get(filename, ())
+    )
+
+
+def update_database_for_split_images() -> set:
     """
     掃描 medicine_photos 資料夾,找出所有 _1.jpg 和 _2.jpg 的圖片
     自動更新資料庫記錄
+
+    說明:
+    - 整個掃描在單一 BEGIN IMMEDIATE 交易內執行，先取得寫入鎖
+    - UPDATE / INSERT 先收集起來，最後以 executemany 一次寫入並 COMMIT（只同步磁碟一次）
+    - 發生錯誤時 ROLLBACK，資料庫維持原狀
+
+    回傳:
+        dict: 掃描到的圖片資料夾檔名 _scan_filenames（可傳給 verify_database，避免重新掃描）
     """
     db_path = "drug_recognition.db"
-    photo_dir = Path("medicine_photos")
 
-    conn = sqlite3.connect(db_path)
+    # isolation_level=None：由程式自行管理 BEGIN / COMMIT
+    conn = sqlite3.connect(db_path, isolation_level=None)
     cursor = conn.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    _ensure_indexes(cursor)
 
-    # 找出所有 _1.jpg 檔案
-    split_files = {}
-    for file in photo_dir.glob("*_1.jpg"):
-        base_name = file.stem[:-2]  # 移除 _1
-        original_name = f"{base_name}.jpg"
-        split_files[base_name] = {
-            "original": original_name,
-            "file_1": f"{base_name}_1.jpg",
-            "file_2": f"{base_name}_2.jpg",
-            "has_2": (photo_dir / f"{base_name}_2.jpg").exists(),
-        }
+    # 單次掃描資料夾取得所有檔名，之後以小寫檔名判斷 _2.jpg 是否存在（不必逐檔 stat）
+    names = _scan_filenames(PHOTO_DIR)
+
+    # 找出所有 _1.jpg 檔案（副檔名不分大小寫；基底名稱保留原始大小寫，寫入資料庫用）
+    bases = sorted(
+        name[:-6] for lower_name, name in names.items() if lower_name.endswith("_1.jpg")
+    )  # 移除 _1.jpg
+    has_2 = [f"{base_name}_2.jpg".lower() in names for base_name in bases]
 
     print("=" * 70)
     print("掃描到的分割圖片:")
@@ -104,64 +156,55 @@ def update_database_for_split_images():
     added_count = 0
     skipped_count = 0
 
-    for base_name, files in split_files.items():
+    # 待寫入的變更：(新檔名, 新路徑, 圖片 id) 與 (藥物 id, 檔名, 路徑, 順序)
+    updates = []
+    inserts = []
+
+    cursor.execute("BEGIN IMMEDIATE")
+
+    # 一次讀入所有圖片記錄：檔名 -> [(圖片 id, 藥物 id), ...]（依 id 排序），迴圈內不再逐筆查詢
+    cursor.execute("SELECT id, drug_id, image_filename FROM drug_images ORDER BY id")
+    by_name = {}
+    for image_id, drug_id, filename in cursor:
+        by_name.setdefault(filename, []).append((image_id, drug_id))
+
+    for base_name, base_has_2 in zip(bases, has_2):
+        files = {
+            "original": f"{base_name}.jpg",
+            "file_1": f"{base_name}_1.jpg",
+            "file_2": f"{base_name}_2.jpg",
+        }
         print(f"\n處理: {base_name}")
 
-        if not files["has_2"]:
+        if not base_has_2:
             print(f"  ⚠️ 跳過: 找不到 {files['file_2']}")
             skipped_count += 1
             continue
 
         # 檢查原始檔案是否在資料庫中
-        cursor.execute(
-            """
-            SELECT drug_id, id 
-            FROM drug_images 
-            WHERE image_filename = ?
-        """,
-            (files["original"],),
-        )
-
-        original_record = cursor.fetchone()
+        original_records = by_name.get(files["original"])
 
-        if original_record:
-            drug_id, original_id = original_record
+        if original_records:
+            original_id, drug_id = original_records[0]
 
             # 檢查是否已經有 _1 和 _2 的記錄
-            cursor.execute(
-                """
-                SELECT COUNT(*) 
-                FROM drug_images 
-                WHERE drug_id = ? AND (image_filename = ? OR image_filename = ?)
-            """,
-                (drug_id, files["file_1"], files["file_2"]),
+            existing_count = _count_records(
+                by_name, drug_id, files["file_1"], files["file_2"]
             )
 
-            existing_count = cursor.fetchone()[0]
-
             if existing_count == 2:
                 print(f"  ✓ 已存在兩筆記錄,跳過")
                 skipped_count += 1
                 continue
 
             # 更新原始記錄為 _1
-            cursor.execute(
-                """
-                UPDATE drug_images 
-                SET image_filename = ?,
-                    image_path = ?
-                WHERE id = ?
-            """,
-                (files["file_1"], f"medicine_photos\\{files['file_1']}", original_id),
+            updates.append(
+                (files["file_1"], os.path.join(PHOTO_DIR, files["file_1"]), original_id)
             )
 
             # 新增 _2 記錄
-            cursor.execute(
-                """
-                INSERT INTO drug_images (drug_id, image_filename, image_path, image_order)
-                VALUES (?, ?, ?, ?)
-            """,
-                (drug_id, files["file_2"], f"medicine_photos\\{files['file_2']}", 2),
+            inserts.append(
+                (drug_id, files["file_2"], os.path.join(PHOTO_DIR, files["file_2"]), 2)
             )
 
             print(
@@ -170,43 +213,21 @@ def update_database_for_split_images():
             updated_count += 1
         else:
             # 原始記錄不存在,檢查是否已經有 _1 記錄
-            cursor.execute(
-                """
-                SELECT drug_id 
-                FROM drug_images 
-                WHERE image_filename = ?
-            """,
-                (files["file_1"],),
-            )
-
-            record_1 = cursor.fetchone()
+            records_1 = by_name.get(files["file_1"])
 
-            if record_1:
-                drug_id = record_1[0]
+            if records_1:
+                drug_id = records_1[0][1]
 
                 # 檢查是否已有 _2 記錄
-                cursor.execute(
-                    """
-                    SELECT COUNT(*) 
-                    FROM drug_images 
-                    WHERE drug_id = ? AND image_filename = ?
-                """,
-                    (drug_id, files["file_2"]),
-                )
-
-                if cursor.fetchone()[0] == 0:
+                if _count_records(by_name, drug_id, files["file_2"]) == 0:
                     # 新增 _2 記錄
-                    cursor.execute(
-                        """
-                        INSERT INTO drug_images (drug_id, image_filename, image_path, image_order)
-                        VALUES (?, ?, ?, ?)
-                    """,
+                    inserts.append(
                         (
                             drug_id,
                             files["file_2"],
-                            f"medicine_photos\\{files['file_2']}",
+                            os.path.join(PHOTO_DIR, files["file_2"]),
                             2,
-                        ),
+                        )
                     )
 
                     print(f"  ✅ 已新增第二張: {files['file_2']}")
@@ -218,8 +239,29 @@ def update_database_for_split_images():
                 print(f"  ⚠️ 找不到對應的藥物記錄")
                 skipped_count += 1
 
-    conn.commit()
-    conn.close()
+    try:
+        cursor.executemany(
+            """
+            UPDATE drug_images 
+            SET image_filename = ?,
+                image_path = ?
+            WHERE id = ?
+        """,
+            updates,
+        )
+        cursor.executemany(
+            """
+            INSERT INTO drug_images (drug_id, image_filename, image_path, image_order)
+            VALUES (?, ?, ?, ?)
+        """,
+            inserts,
+        )
+        cursor.execute("COMMIT")
+    except sqlite3.Error:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
 
     print("\n" + "=" * 70)
     print("處理完成!")
@@ -229,55 +271,57 @@ def update_database_for_split_images():
     print(f"⏭️  跳過: {skipped_count} 個檔案")
     print("=" * 70)
 
+    return names
+
+
+def verify_database(fs_names: dict = None):
+    """
+    驗證資料庫狀態
 
-def verify_database():
-    """驗證資料庫狀態"""
+    參數:
+        fs_names (dict): 圖片資料夾檔名 _scan_filenames，None 時自行掃描 PHOTO_DIR
+    """
     conn = sqlite3.connect("drug_recognition.db")
     cursor = conn.cursor()
+    _ensure_indexes(cursor)
 
     print("\n" + "=" * 70)
     print("資料庫驗證:")
     print("=" * 70)
 
-    # 檢查有多張圖片的藥物
-    cursor.execute(
-        """
-        SELECT drug_id, COUNT(*) as cnt 
-        FROM drug_images 
-        GROUP BY drug_id 
-        HAVING cnt > 1
-    """
-    )
-
-    multi_image_drugs = cursor.fetchall()
-    print(f"有多張圖片的藥物: {len(multi_image_drugs)} 個")
-
-    # 檢查 _1, _2 圖片
+    # 一次查詢：有多張圖片的藥物數、_1 / _2 分割圖片數
+    # （LIKE 中 _ 為單字元萬用字元，需以 ESCAPE 跳脫，否則 "xx1.jpg" 也會被算入）
     cursor.execute(
         """
-        SELECT COUNT(*) 
-        FROM drug_images 
-        WHERE image_filename LIKE '%_1.jpg' OR image_filename LIKE '%_2.jpg'
+        SELECT
+            (SELECT COUNT(*) FROM (
+                SELECT drug_id
+                FROM drug_images
+                GROUP BY drug_id
+                HAVING COUNT(*) > 1
+            )),
+            (SELECT COUNT(*)
+             FROM drug_images
+             WHERE image_filename LIKE '%\\_1.jpg' ESCAPE '\\'
+                OR image_filename LIKE '%\\_2.jpg' ESCAPE '\\')
     """
     )
 
-    split_images = cursor.fetchone()[0]
+    multi_image_count, split_images = cursor.fetchone()
+    print(f"有多張圖片的藥物: {multi_image_count} 個")
     print(f"分割圖片總數: {split_images} 張")
 
-    # 檢查檔案是否存在
+    # 檢查檔案是否存在：以小寫檔名比對資料夾檔名（不必逐檔 stat，同 Windows 不分大小寫）
+    if fs_names is None:
+        fs_names = _scan_filenames(PHOTO_DIR)
     cursor.execute("SELECT image_filename FROM drug_images")
-    missing_files = []
-    photo_dir = Path("medicine_photos")
-
-    for row in cursor.fetchall():
-        filename = row[0]
-        if not (photo_dir / filename).exists():
-            missing_files.append(filename)
+    db_names = {filename for (filename,) in cursor}  # 直接逐列讀取，不先 fetchall
+    missing_files = sorted(name for name in db_names if name.lower() not in fs_names)
 
     if missing_files:
         print(f"\n⚠️ 找不到的檔案 ({len(missing_files)} 個):")
-        for f in missing_files[:10]:  # 只顯示前10個
-            print(f"  - {f}")
+        # 只顯示前10個（組成一個字串後一次輸出）
+        print("\n".join(f"  - {f}" for f in missing_files[:10]))
         if len(missing_files) > 10:
             print(f"  ... 還有 {len(missing_files) - 10} 個")
     else:
@@ -298,7 +342,7 @@ if __name__ == "__main__":
     response = input("是否繼續? (y/n): ").strip().lower()
 
     if response == "y":
-        update_database_for_split_images()
-        verify_database()
+        fs_names = update_database_for_split_images()
+        verify_database(fs_names=fs_names)
     else:
         print("已取消")